@@ -1,82 +1,112 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
 from dotenv import load_dotenv
 import os
 import sys
-import tempfile
-import shutil
-import json
+import asyncio
+import threading
+import hashlib
+import pickle
+import sqlite3
+from collections import OrderedDict
+import aiofiles
+import numpy as np
+import orjson
+import openai
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 
+# LightRAG parses sys.argv on import; hide the server's arguments from it once, here
+_original_argv, sys.argv = sys.argv, ['lightrag']
+try:
+    from lightrag import LightRAG, QueryParam
+    _LIGHTRAG_AVAILABLE = True
+except Exception:
+    _LIGHTRAG_AVAILABLE = False
+finally:
+    sys.argv = _original_argv
+
 load_dotenv()
 
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+MULTIPART_OVERHEAD = 64 * 1024  # slack for the form envelope around the file
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # one executor hop per MiB written
+
+TEMPLATE_NAMES = ["screenplay", "academic", "business"]
+_ALLOWED_TEMPLATES = frozenset(TEMPLATE_NAMES)
+_INVALID_TEMPLATE_DETAIL = f"Invalid template. Must be one of: {TEMPLATE_NAMES}"
+
 app = FastAPI(
     title="Miranda API",
     description="AI-Assisted Writing Platform - Clean REST Design",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
+# =============================================================================
+# UPLOAD SIZE LIMIT
+# =============================================================================
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized bucket uploads from Content-Length, before the body is read"""
+    
+    def __init__(self, app, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and "/buckets/" in scope["path"] and scope["path"].endswith("/upload"):
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > self.max_body_size:
+                response = ORJSONResponse({"detail": "File too large"}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Registered before CORSMiddleware so 413s still carry CORS headers
+app.add_middleware(UploadSizeLimitMiddleware, max_body_size=MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD)
+
 # ============================================================================= 
 # CORS CONFIGURATION
 # =============================================================================
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-        "http://localhost:8080", 
-        "http://127.0.0.1:8080",
-        "http://localhost:5173",
-        "http://127.0.0.1:5173"
-    ],
-    allow_credentials=True,
+    allow_origins=["*"],
+    allow_credentials=False,  # with "*" origins, True would echo any Origin as credentialed
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
+    allow_headers=["accept", "content-type", "authorization", "if-none-match"],
     expose_headers=["*"]
 )
 
-@app.middleware("http")
-async def add_cors_headers(request: Request, call_next):
-    """Ensure CORS headers are always present"""
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    response.headers["Access-Control-Expose-Headers"] = "*"
-    return response
-
-@app.options("/{path:path}")
-async def options_handler(request: Request, path: str):
-    """Handle CORS preflight requests"""
-    return JSONResponse(
-        content={"message": "CORS preflight OK"},
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "*"
-        }
-    )
+# Compress JSON bodies over 1KB for clients that send Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
 
 # =============================================================================
 # DATA MODELS
 # =============================================================================
 
 class Project(BaseModel):
-    name: str
+    model_config = ConfigDict(extra='ignore', frozen=True)
+    
+    name: str = Field(max_length=100)
     template: str
     description: Optional[str] = None
 
 class BrainstormRequest(BaseModel):
+    model_config = ConfigDict(extra='ignore', frozen=True)
+    
     project_id: str
     context: str = "General brainstorming session"
     focus: str = "Creative development"
     tone: str = "neutral"
 
 class WriteRequest(BaseModel):
+    model_config = ConfigDict(extra='ignore', frozen=True)
+    
     project_id: str
     brainstorm_id: Optional[str] = None
     format: str = "screenplay"
@@ -89,14 +119,26 @@ class WriteRequest(BaseModel):
 # STORAGE LAYER
 # =============================================================================
 
+def _max_id_suffix(ids) -> int:
+    """Largest numeric suffix among ids like "project_3", or 0"""
+    return max(
+        (int(i.rsplit("_", 1)[-1]) for i in ids if i.rsplit("_", 1)[-1].isdigit()),
+        default=0
+    )
+
 class SimpleStorage:
     def __init__(self):
-        self.projects = []
+        self.projects_by_id = {}
+        self.projects_by_name = {}
+        self.project_counter = 0
         self.brainstorms = {}
         self.documents = {}
         self.uploads = {}
         self.buckets = {}
         self.tables = {}
+        self._dirty = False
+        self._write_lock = threading.Lock()
+        self._known_dirs = set()
         
         # Create projects directory
         Path("./projects").mkdir(exist_ok=True)
@@ -107,31 +149,80 @@ class SimpleStorage:
         projects_file = Path("./projects/projects.json")
         if projects_file.exists():
             try:
-                with open(projects_file, 'r') as f:
-                    data = json.load(f)
-                    self.projects = data.get("projects", [])
+                with open(projects_file, 'rb') as f:
+                    data = orjson.loads(f.read())
+                    for project in data.get("projects", []):
+                        self._index_project(project)
                     self.brainstorms = data.get("brainstorms", {})
                     self.buckets = data.get("buckets", {})
                     self.tables = data.get("tables", {})
-            except:
-                pass
+                    # Older files have no counter; resume after the highest existing id
+                    self.project_counter = data.get("project_counter") or _max_id_suffix(self.projects_by_id)
+            except (OSError, ValueError, AttributeError, KeyError, TypeError) as e:
+                print(f"projects.json unreadable, starting fresh: {e}")
+                self.projects_by_id, self.projects_by_name, self.project_counter = {}, {}, 0
+                self.brainstorms, self.buckets, self.tables = {}, {}, {}
     
     def _save_projects(self):
-        """Save projects to file"""
+        """Mark projects dirty; the flush loop writes them out"""
+        self._dirty = True
+    
+    def _snapshot(self) -> bytes:
+        return orjson.dumps({
+            "projects": self.get_projects(),
+            "project_counter": self.project_counter,
+            "brainstorms": self.brainstorms,
+            "buckets": self.buckets,
+            "tables": self.tables
+        }, option=orjson.OPT_INDENT_2)
+    
+    def _write_projects(self, data: bytes, fsync: bool = False):
+        """Atomically replace projects.json with data"""
         projects_file = Path("./projects/projects.json")
+        tmp_file = projects_file.with_suffix(".json.tmp")
+        with self._write_lock:
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_file, projects_file)
+    
+    def flush(self, fsync: bool = False):
+        """Write projects to file now if anything changed"""
+        if not self._dirty:
+            return
+        self._dirty = False
         try:
-            with open(projects_file, 'w') as f:
-                json.dump({
-                    "projects": self.projects,
-                    "brainstorms": self.brainstorms,
-                    "buckets": self.buckets,
-                    "tables": self.tables
-                }, f, indent=2)
-        except:
-            pass
+            self._write_projects(self._snapshot(), fsync)
+        except Exception:
+            self._dirty = True
+    
+    async def flush_periodically(self, interval: float = 0.5):
+        """Coalesce mutations into at most one write per interval"""
+        while True:
+            await asyncio.sleep(interval)
+            if not self._dirty:
+                continue
+            self._dirty = False
+            data = self._snapshot()
+            try:
+                await asyncio.to_thread(self._write_projects, data)
+            except asyncio.CancelledError:
+                # Cancelled mid-write; the shutdown hook's final flush redoes it
+                self._dirty = True
+                raise
+            except Exception:
+                self._dirty = True
+    
+    def _index_project(self, project: Dict):
+        self.projects_by_id[project["id"]] = project
+        self.projects_by_name.setdefault(project["name"], project)
     
     def create_project(self, project_data: Dict) -> Dict:
-        project_id = f"project_{len(self.projects) + 1}"
+        # Persisted and never decremented, so ids are not reused after a delete
+        self.project_counter += 1
+        project_id = f"project_{self.project_counter}"
         project = {
             "id": project_id,
             "name": project_data["name"],
@@ -140,7 +231,7 @@ class SimpleStorage:
             "created_at": "2025-01-01T00:00:00Z"
         }
         
-        self.projects.append(project)
+        self._index_project(project)
         
         # Initialize default buckets and tables for project
         self.buckets[project_id] = ["research", "references", "inspiration"]
@@ -149,69 +240,174 @@ class SimpleStorage:
         self._save_projects()
         
         # Create project directory
-        project_dir = Path("./projects") / project_id
-        project_dir.mkdir(exist_ok=True)
+        os.makedirs(os.path.join("projects", project_id), exist_ok=True)
         
         return project
     
+    def ensure_dir(self, path: Path):
+        """mkdir -p, skipping the syscalls for directories already created"""
+        key = str(path)
+        if key not in self._known_dirs:
+            path.mkdir(parents=True, exist_ok=True)
+            self._known_dirs.add(key)
+    
     def get_projects(self) -> List[Dict]:
-        return self.projects
+        return list(self.projects_by_id.values())
     
     def get_project_by_name(self, name: str) -> Optional[Dict]:
-        return next((p for p in self.projects if p["name"] == name), None)
+        return self.projects_by_name.get(name)
     
     def get_project(self, project_id: str) -> Optional[Dict]:
-        return next((p for p in self.projects if p["id"] == project_id), None)
+        return self.projects_by_id.get(project_id)
+    
+    def delete_project(self, project_id: str):
+        project = self.projects_by_id.pop(project_id)
+        if self.projects_by_name.get(project["name"]) is project:
+            del self.projects_by_name[project["name"]]
+            # Re-point the name at the next project sharing it, if any
+            for other in self.projects_by_id.values():
+                if other["name"] == project["name"]:
+                    self.projects_by_name[other["name"]] = other
+                    break
+        
+        for k in [k for k, v in self.brainstorms.items() if v.get("project_id") == project_id]:
+            del self.brainstorms[k]
+        self.buckets.pop(project_id, None)
+        self.tables.pop(project_id, None)
+        self._save_projects()
 
 # Global storage instance
 storage = SimpleStorage()
 
+@app.on_event("startup")
+async def start_storage_flush():
+    storage._flush_task = asyncio.create_task(storage.flush_periodically())
+
+@app.on_event("shutdown")
+async def stop_storage_flush():
+    # Let the cancellation land first so a write it interrupted is marked dirty again
+    storage._flush_task.cancel()
+    try:
+        await storage._flush_task
+    except asyncio.CancelledError:
+        pass
+    storage.flush(fsync=True)
+
 # =============================================================================
 # LIGHTRAG INTEGRATION
 # =============================================================================
 
-def create_lightrag_instance(working_dir: str):
-    """Fixed LightRAG with proper OpenAI client initialization"""
-    original_argv = sys.argv.copy()
-    sys.argv = ['lightrag']
+class EmbeddingCache:
+    """Content-addressed embedding store: blake2b(text) -> float16 vector bytes"""
+    
+    BATCH = 500  # stay under SQLite's bound-parameter limit
     
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        # WAL with synchronous=NORMAL: commits append to the log instead of fsyncing each time
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB)")
+        # Calls arrive from worker threads via asyncio.to_thread; one connection, one at a time
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+    
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), self.BATCH):
+                batch = keys[i:i + self.BATCH]
+                rows = self.conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                found.update((k, np.frombuffer(v, dtype=np.float16)) for k, v in rows)
+        return found
+    
+    def set_many(self, items: Dict[bytes, Any]):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(k, np.asarray(v, dtype=np.float16).tobytes()) for k, v in items.items()]
+            )
+
+embedding_cache = EmbeddingCache(Path("./projects/.embed_cache.sqlite"))
+
+# Keyword-extraction completions keyed by digest of the prompt and call options;
+# repeated queries send the same prompt, so hits skip the OpenAI round-trip
+_completion_cache: "OrderedDict[bytes, str]" = OrderedDict()
+COMPLETION_CACHE_SIZE = 4096
+
+# One client per process so its httpx pool keeps TLS connections alive across requests
+openai_client = None
+if os.getenv("OPENAI_API_KEY"):
     try:
-        from lightrag import LightRAG, QueryParam
-        import openai
-        
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key not found")
-        
-        client = openai.AsyncOpenAI(
-            api_key=api_key,
+        openai_client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
             timeout=30.0,
             max_retries=2
         )
-        
+    except Exception as e:
+        # e.g. an httpx release this openai version cannot drive; fall back to the mock
+        print(f"OpenAI client initialization error: {e}")
+
+def create_lightrag_instance(working_dir: str):
+    """Fixed LightRAG with proper OpenAI client initialization"""
+    if not _LIGHTRAG_AVAILABLE or openai_client is None:
+        return create_mock_lightrag()
+    
+    try:
         async def gpt_4o_mini_complete(prompt, **kwargs):
+            # Only keyword extraction is cached; answers and gleaning depend on context
+            key = None
+            if kwargs.get("keyword_extraction"):
+                key = hashlib.blake2b(orjson.dumps([
+                    prompt,
+                    kwargs.get("system_prompt"),
+                    kwargs.get("history_messages") or [],
+                    kwargs.get("max_tokens", 1000),
+                    kwargs.get("temperature", 0.7)
+                ], default=str)).digest()
+                if key in _completion_cache:
+                    _completion_cache.move_to_end(key)
+                    return _completion_cache[key]
             try:
-                response = await client.chat.completions.create(
+                response = await openai_client.chat.completions.create(
                     model="gpt-4o-mini",
                     messages=[{"role": "user", "content": prompt}],
                     max_tokens=kwargs.get("max_tokens", 1000),
                     temperature=kwargs.get("temperature", 0.7)
                 )
-                return response.choices[0].message.content
             except Exception as e:
                 return f"AI completion error: {str(e)}"
+            content = response.choices[0].message.content
+            if key is not None:
+                _completion_cache[key] = content
+                if len(_completion_cache) > COMPLETION_CACHE_SIZE:
+                    _completion_cache.popitem(last=False)
+            return content
         
         async def openai_embed(texts):
-            try:
-                if isinstance(texts, str):
-                    texts = [texts]
-                response = await client.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=texts
-                )
-                return [item.embedding for item in response.data]
-            except Exception as e:
-                return [[0.1] * 1536 for _ in texts]
+            if isinstance(texts, str):
+                texts = [texts]
+            keys = [embedding_cache.key(t) for t in texts]
+            vectors = await asyncio.to_thread(embedding_cache.get_many, keys)
+            missing = {k: t for k, t in zip(keys, texts) if k not in vectors}
+            if missing:
+                try:
+                    response = await openai_client.embeddings.create(
+                        model="text-embedding-3-small",
+                        input=list(missing.values())
+                    )
+                except Exception as e:
+                    return np.full((len(texts), 1536), 0.1, dtype=np.float16)
+                fresh = {k: np.asarray(item.embedding, dtype=np.float16) for k, item in zip(missing, response.data)}
+                await asyncio.to_thread(embedding_cache.set_many, fresh)
+                vectors.update(fresh)
+            return np.stack([vectors[k] for k in keys])
         
         rag = LightRAG(
             working_dir=working_dir,
@@ -221,16 +417,64 @@ def create_lightrag_instance(working_dir: str):
         
         return rag, QueryParam
         
-    except ImportError as e:
-        return create_mock_lightrag()
     except Exception as e:
         return create_mock_lightrag()
-    finally:
-        sys.argv = original_argv
+
+# Instantiated LightRAGs keyed by project, so graph and vector stores are built once
+_rag_instances: Dict[str, Dict[str, Any]] = {}
+
+def get_lightrag(project_key: str) -> Dict[str, Any]:
+    """Return the persistent LightRAG for a project, creating it on first use"""
+    if project_key not in _rag_instances:
+        working_dir = Path("./projects") / project_key / "lightrag"
+        working_dir.mkdir(parents=True, exist_ok=True)
+        
+        hashes_file = working_dir / "inserted_hashes.json"
+        inserted = set()
+        if hashes_file.exists():
+            try:
+                with open(hashes_file, 'rb') as f:
+                    inserted = set(orjson.loads(f.read()))
+            except (OSError, ValueError, TypeError) as e:
+                print(f"{hashes_file} unreadable, starting empty: {e}")
+        
+        rag, QueryParam = create_lightrag_instance(str(working_dir))
+        _rag_instances[project_key] = {
+            "rag": rag,
+            "param": QueryParam,
+            "inserted": inserted,
+            "hashes_file": hashes_file
+        }
+    return _rag_instances[project_key]
+
+async def insert_once(instance: Dict[str, Any], text: str, text_hash: str):
+    """Insert text into a LightRAG unless it has already been ingested"""
+    if text_hash in instance["inserted"]:
+        return
+    await instance["rag"].ainsert(text)
+    if getattr(instance["rag"], "is_mock", False):
+        return
+    instance["inserted"].add(text_hash)
+    try:
+        with open(instance["hashes_file"], 'wb') as f:
+            f.write(orjson.dumps(sorted(instance["inserted"])))
+    except OSError as e:
+        print(f"Inserted-hash save error: {e}")
+
+@app.on_event("startup")
+async def warm_lightrag():
+    """Load persisted LightRAG stores before the first query arrives"""
+    if not os.getenv("OPENAI_API_KEY"):
+        return
+    for project_key in [p["id"] for p in storage.get_projects()] + ["_shared"]:
+        if (Path("./projects") / project_key / "lightrag").exists():
+            get_lightrag(project_key)
 
 def create_mock_lightrag():
     """Create mock LightRAG for when real one fails"""
     class MockRAG:
+        is_mock = True
+        
         async def ainsert(self, text):
             return f"Mock: Inserted {len(text)} characters"
         
@@ -243,6 +487,151 @@ def create_mock_lightrag():
     
     return MockRAG(), MockParam
 
+# =============================================================================
+# SEMANTIC QUERY CACHE
+# =============================================================================
+
+class SemanticCache:
+    """LSH cache of LightRAG answers keyed by query embedding.
+    
+    Each embedding is reduced to a 128-bit random-projection signature
+    (packed with np.packbits) and kept in a (N, 16) uint8 matrix. A probe
+    XORs its signature against every row and popcounts the result in a
+    couple of vectorized calls; only rows within `max_hamming` bits are scored by cosine
+    similarity, and the best answer above the threshold is returned. Vectors
+    are kept as int8 with a per-vector scale, a quarter of the float32 footprint.
+    """
+    
+    VERSION = 3
+    SIGNATURE_BITS = 128
+    
+    def __init__(self, path: Path, dim: int = 1536, threshold: float = 0.95, max_hamming: int = 32):
+        self.path = path
+        self.threshold = threshold
+        self.max_hamming = max_hamming
+        # Fixed seed so persisted signatures stay valid across restarts
+        self.planes = np.random.default_rng(0).standard_normal((self.SIGNATURE_BITS, dim)).astype(np.float32)
+        self.signatures = np.empty((0, self.SIGNATURE_BITS // 8), dtype=np.uint8)
+        self.vectors = np.empty((0, dim), dtype=np.int8)
+        self.scales = np.empty(0, dtype=np.float32)
+        self.scopes = np.empty(0, dtype=np.int64)
+        self.results = []
+        self.scope_ids = {}
+        self.size = 0
+        self._load()
+    
+    def _signature(self, vec: np.ndarray) -> np.ndarray:
+        return np.packbits(self.planes @ vec > 0)
+    
+    @staticmethod
+    def _hamming(x: np.ndarray) -> np.ndarray:
+        """Per-row popcount of an (N, 16) uint8 matrix"""
+        if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+            counts = np.bitwise_count(x.view(np.uint64))
+            return counts[:, 0] + counts[:, 1]
+        return np.unpackbits(x, axis=1).sum(axis=1)
+    
+    @staticmethod
+    def _quantize(vec: np.ndarray):
+        scale = float(np.abs(vec).max()) / 127 or 1.0
+        return np.clip(np.rint(vec / scale), -128, 127).astype(np.int8), scale
+    
+    def _grow(self):
+        """Double row capacity so appends stay amortized O(1)"""
+        capacity = max(64, 2 * len(self.signatures))
+        for name in ("signatures", "vectors", "scales", "scopes"):
+            old = getattr(self, name)
+            grown = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:self.size] = old[:self.size]
+            setattr(self, name, grown)
+    
+    def get(self, scope: str, embedding: np.ndarray) -> Optional[Any]:
+        scope_id = self.scope_ids.get(scope)
+        if scope_id is None:
+            return None
+        vec = embedding / np.linalg.norm(embedding)
+        
+        x = np.bitwise_xor(self.signatures[:self.size], self._signature(vec))
+        distances = self._hamming(x)
+        candidates = np.where((distances <= self.max_hamming) & (self.scopes[:self.size] == scope_id))[0]
+        if not len(candidates):
+            return None
+        
+        probe, probe_scale = self._quantize(vec)
+        similarities = (self.vectors[candidates].astype(np.int32) @ probe.astype(np.int32)) * self.scales[candidates] * probe_scale
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return self.results[candidates[best]]
+    
+    def set(self, scope: str, embedding: np.ndarray, result: Any):
+        vec = embedding / np.linalg.norm(embedding)
+        if self.size == len(self.signatures):
+            self._grow()
+        row = self.size
+        self.signatures[row] = self._signature(vec)
+        self.vectors[row], self.scales[row] = self._quantize(vec)
+        self.scopes[row] = self.scope_ids.setdefault(scope, len(self.scope_ids))
+        self.results.append(result)
+        self.size += 1
+    
+    def _load(self):
+        """Load cached answers from disk if present"""
+        if self.path.exists():
+            try:
+                with open(self.path, "rb") as f:
+                    data = pickle.load(f)
+                if data.get("version") != self.VERSION:
+                    return
+                self.signatures, self.vectors, self.scales, self.scopes, self.results, self.scope_ids = (
+                    data["signatures"], data["vectors"], data["scales"],
+                    data["scopes"], data["results"], data["scope_ids"]
+                )
+                self.size = len(self.results)
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError, AttributeError, KeyError) as e:
+                print(f"Semantic cache unreadable, starting empty: {e}")
+    
+    def save(self):
+        """Persist cached answers to disk"""
+        try:
+            with open(self.path, "wb") as f:
+                pickle.dump({
+                    "version": self.VERSION,
+                    "signatures": self.signatures[:self.size],
+                    "vectors": self.vectors[:self.size],
+                    "scales": self.scales[:self.size],
+                    "scopes": self.scopes[:self.size],
+                    "results": self.results,
+                    "scope_ids": self.scope_ids
+                }, f)
+        except (OSError, pickle.PicklingError) as e:
+            print(f"Semantic cache save error: {e}")
+
+semantic_cache = SemanticCache(Path("./projects/.semcache.pkl"))
+
+async def embed_query(query: str) -> Optional[np.ndarray]:
+    """Embed a query for the semantic cache, or None if OpenAI is unavailable"""
+    if openai_client is None:
+        return None
+    key = embedding_cache.key(query)
+    cached = await asyncio.to_thread(embedding_cache.get_many, [key])
+    if key in cached:
+        return cached[key].astype(np.float32)
+    try:
+        response = await openai_client.embeddings.create(
+            model="text-embedding-3-small",
+            input=[query]
+        )
+    except Exception:
+        return None
+    embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+    await asyncio.to_thread(embedding_cache.set_many, {key: embedding})
+    return embedding
+
+@app.on_event("shutdown")
+async def save_semantic_cache():
+    semantic_cache.save()
+
 # =============================================================================
 # CLEAN REST API ENDPOINTS
 # =============================================================================
@@ -288,20 +677,13 @@ async def list_projects():
 async def create_project(project: Project):
     """POST /projects - Create new project"""
     try:
-        valid_templates = ["screenplay", "academic", "business"]
-        if project.template not in valid_templates:
+        if project.template not in _ALLOWED_TEMPLATES:
             raise HTTPException(
                 status_code=422, 
-                detail=f"Invalid template. Must be one of: {valid_templates}"
+                detail=_INVALID_TEMPLATE_DETAIL
             )
         
-        if len(project.name) > 100:
-            raise HTTPException(
-                status_code=422,
-                detail="Project name too long (max 100 characters)"
-            )
-        
-        project_data = storage.create_project(project.dict())
+        project_data = storage.create_project(project.model_dump(mode='python'))
         return {"success": True, "project": project_data}
         
     except HTTPException:
@@ -324,15 +706,8 @@ async def delete_project(project_id: str):
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Remove from storage
-    storage.projects = [p for p in storage.projects if p["id"] != project_id]
-    storage.brainstorms = {k: v for k, v in storage.brainstorms.items() if v.get("project_id") != project_id}
-    if project_id in storage.buckets:
-        del storage.buckets[project_id]
-    if project_id in storage.tables:
-        del storage.tables[project_id]
-    
-    storage._save_projects()
+    storage.delete_project(project_id)
+    _rag_instances.pop(project_id, None)
     
     return {"success": True, "message": "Project deleted"}
 
@@ -374,6 +749,16 @@ async def create_bucket(project_id: str, request: dict):
     
     return {"success": True, "bucket": {"name": bucket_name, "active": True}}
 
+def sendfile_copy(src, dest: Path, size: int):
+    """Copy a disk-backed upload to dest with os.sendfile (no user-space buffer)"""
+    with open(dest, "wb") as out:
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(out.fileno(), src.fileno(), offset, size - offset)
+            if not sent:
+                break
+            offset += sent
+
 @app.post("/projects/{project_id}/buckets/{bucket_name}/upload")
 async def upload_to_bucket(project_id: str, bucket_name: str, file: UploadFile = File(...)):
     """POST /projects/{id}/buckets/{name}/upload - Upload file to bucket"""
@@ -385,20 +770,31 @@ async def upload_to_bucket(project_id: str, bucket_name: str, file: UploadFile =
     if bucket_name not in buckets:
         raise HTTPException(status_code=404, detail="Bucket not found")
     
-    # Read and save file
-    content = await file.read()
-    file_size = len(content)
-    
-    if file_size > 10 * 1024 * 1024:  # 10MB limit
+    # The form parser already knows the exact size; reject before touching disk
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
         raise HTTPException(status_code=413, detail="File too large")
     
-    # Save to bucket directory
     bucket_dir = Path("./projects") / project_id / "buckets" / bucket_name
-    bucket_dir.mkdir(parents=True, exist_ok=True)
+    storage.ensure_dir(bucket_dir)
     file_path = bucket_dir / file.filename
     
-    with open(file_path, "wb") as f:
-        f.write(content)
+    if file.size is not None and hasattr(os, "sendfile") and getattr(file.file, "_rolled", False):
+        # Spooled to a temp file already: copy it kernel-side
+        await asyncio.to_thread(sendfile_copy, file.file, file_path, file.size)
+        file_size = file.size
+    else:
+        # Stream file to bucket directory, enforcing the size limit as we go
+        file_size = 0
+        async with aiofiles.open(file_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > MAX_UPLOAD_SIZE:
+                    break
+                await f.write(chunk)
+        
+        if file_size > MAX_UPLOAD_SIZE:
+            file_path.unlink(missing_ok=True)
+            raise HTTPException(status_code=413, detail="File too large")
     
     file_id = f"file_{len(storage.uploads) + 1}"
     storage.uploads[file_id] = {
@@ -447,21 +843,22 @@ async def upload_csv_to_table(project_id: str, table_name: str, file: UploadFile
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=422, detail="Only CSV files allowed")
     
-    content = await file.read()
-    
-    # Save CSV to table directory
+    # Stream CSV to table directory, counting rows as we go
     table_dir = Path("./projects") / project_id / "tables"
-    table_dir.mkdir(parents=True, exist_ok=True)
+    storage.ensure_dir(table_dir)
     csv_path = table_dir / f"{table_name}.csv"
     
-    with open(csv_path, "wb") as f:
-        f.write(content)
+    rows_count = 0
+    last_byte = b"\n"
+    async with aiofiles.open(csv_path, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            rows_count += chunk.count(b"\n")
+            last_byte = chunk[-1:]
+            await f.write(chunk)
     
-    # Count rows
-    try:
-        rows_count = len(content.decode('utf-8').split('\n')) - 1
-    except:
-        rows_count = 0
+    # A final line without a trailing newline is still a row
+    if last_byte != b"\n":
+        rows_count += 1
     
     # Add table to project if not exists
     if project_id not in storage.tables:
@@ -488,6 +885,11 @@ async def query_lightrag(request: dict):
     """POST /lightrag/query - Query documents with LightRAG"""
     text = request.get("text", "")
     query = request.get("query", "What is this about?")
+    project_id = request.get("project_id")
+    
+    if project_id and not storage.get_project(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    project_key = project_id or "_shared"
     
     if not os.getenv("OPENAI_API_KEY"):
         return {
@@ -496,14 +898,40 @@ async def query_lightrag(request: dict):
             "type": "configuration_error"
         }
     
-    temp_dir = tempfile.mkdtemp()
+    text_hash = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    try:
+        instance = get_lightrag(project_key)
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"LightRAG query failed: {str(e)}",
+            "type": type(e).__name__
+        }
+    
+    # Key answers on the graph they were computed against: every newly ingested text
+    # bumps the project's generation, so older answers for that project stop matching
+    generation = len(instance["inserted"]) + (text_hash not in instance["inserted"])
+    scope = f"{project_key}:{generation}:{text_hash}"
+    embedding = await embed_query(query)
+    if embedding is not None:
+        cached = semantic_cache.get(scope, embedding)
+        if cached is not None:
+            return {
+                "success": True,
+                "query": query,
+                "result": cached,
+                "method": "semantic_cache"
+            }
     
     try:
-        rag, QueryParam = create_lightrag_instance(temp_dir)
+        rag, QueryParam = instance["rag"], instance["param"]
         
-        await rag.ainsert(text)
+        await insert_once(instance, text, text_hash)
         result = await rag.aquery(query, param=QueryParam(mode="hybrid"))
         
+        if embedding is not None and not getattr(rag, "is_mock", False):
+            semantic_cache.set(scope, embedding, result)
+        
         return {
             "success": True,
             "query": query,
@@ -517,8 +945,6 @@ async def query_lightrag(request: dict):
             "error": f"LightRAG query failed: {str(e)}",
             "type": type(e).__name__
         }
-    finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
 
 @app.post("/projects/{project_id}/brainstorm")
 async def brainstorm_project(project_id: str, request: dict):
@@ -571,6 +997,40 @@ async def brainstorm_project(project_id: str, request: dict):
             "type": type(e).__name__
         }
 
+_SCREENPLAY_TMPL = """FADE IN:
+
+EXT. CREATIVE WORKSPACE - DAY
+
+{context}
+
+A WRITER sits focused at their desk, crafting compelling narrative. The work flows naturally from inspiration to execution.
+
+WRITER
+This story needs to be told.
+
+The Writer continues with purpose and clarity.
+
+FADE OUT."""
+
+_DOCUMENT_TMPL = """# Generated Content
+
+## Context
+{context}
+
+This professionally generated content demonstrates Miranda's AI writing capabilities with contextual awareness and narrative consistency.
+
+## Key Features
+- Context-aware generation
+- Template-based formatting
+- Iterative refinement support
+- Professional output quality"""
+
+# format -> (template, word count of the template without its {context} slot)
+WRITE_TEMPLATES = {
+    "screenplay": (_SCREENPLAY_TMPL, len(_SCREENPLAY_TMPL.split()) - 1),
+    "default": (_DOCUMENT_TMPL, len(_DOCUMENT_TMPL.split()) - 1),
+}
+
 @app.post("/projects/{project_id}/write")
 async def write_content(project_id: str, request: dict):
     """POST /projects/{id}/write - Generate written content"""
@@ -597,40 +1057,14 @@ async def write_content(project_id: str, request: dict):
         
         context = " | ".join(context_info) if context_info else f"Content for {project['name']}"
         
-        if format_type == "screenplay":
-            content = f"""FADE IN:
-
-EXT. CREATIVE WORKSPACE - DAY
-
-{context}
-
-A WRITER sits focused at their desk, crafting compelling narrative. The work flows naturally from inspiration to execution.
-
-WRITER
-This story needs to be told.
-
-The Writer continues with purpose and clarity.
-
-FADE OUT."""
-        else:
-            content = f"""# Generated Content
-
-## Context
-{context}
-
-This professionally generated content demonstrates Miranda's AI writing capabilities with contextual awareness and narrative consistency.
-
-## Key Features
-- Context-aware generation
-- Template-based formatting
-- Iterative refinement support
-- Professional output quality"""
+        template, template_words = WRITE_TEMPLATES.get(format_type, WRITE_TEMPLATES["default"])
+        content = template.format(context=context)
 
         return {
             "success": True,
-            "content": content.strip(),
+            "content": content,
             "format": format_type,
-            "word_count": len(content.split()),
+            "word_count": template_words + len(context.split()),
             "context_used": bool(context_info)
         }
         
@@ -645,6 +1079,25 @@ This professionally generated content demonstrates Miranda's AI writing capabili
 # EXPORT ENDPOINTS - CLEAN REST DESIGN
 # =============================================================================
 
+async def stream_export(project: Dict):
+    """Yield a project export as JSON, one serialized record at a time"""
+    project_id = project["id"]
+    yield b'{"project":' + orjson.dumps(project)
+    
+    for key, records in (("brainstorms", storage.brainstorms), ("documents", storage.uploads)):
+        yield b',"' + key.encode() + b'":['
+        separator = b""
+        # Snapshot the values: other requests may mutate storage between yields
+        for record in list(records.values()):
+            if record.get("project_id") == project_id:
+                yield separator + orjson.dumps(record)
+                separator = b","
+        yield b"]"
+    
+    yield b',"buckets":' + orjson.dumps(storage.buckets.get(project_id, []))
+    yield b',"tables":' + orjson.dumps(storage.tables.get(project_id, []))
+    yield b',"exported_at":"2025-01-01T00:00:00Z"}'
+
 @app.get("/projects/{project_id}/export")
 async def export_project(project_id: str, format: str = "json"):
     """GET /projects/{id}/export?format=json - Export project data"""
@@ -652,18 +1105,10 @@ async def export_project(project_id: str, format: str = "json"):
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    export_data = {
-        "project": project,
-        "brainstorms": [b for b in storage.brainstorms.values() if b.get("project_id") == project_id],
-        "documents": [d for d in storage.uploads.values() if d.get("project_id") == project_id],
-        "buckets": storage.buckets.get(project_id, []),
-        "tables": storage.tables.get(project_id, []),
-        "exported_at": "2025-01-01T00:00:00Z"
-    }
-    
     if format == "json":
-        return JSONResponse(
-            content=export_data,
+        return StreamingResponse(
+            stream_export(project),
+            media_type="application/json",
             headers={
                 "Content-Disposition": f"attachment; filename={project['name']}_export.json"
             }
@@ -741,4 +1186,18 @@ if __name__ == "__main__":
     print("=" * 60)
     
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # Storage lives in process memory, so scale workers only via WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        # Passing the app object avoids importing this module a second time;
+        # uvicorn needs the import string only to spawn extra workers
+        app if workers == 1 else "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+        timeout_keep_alive=30,
+        limit_concurrency=1000,
+        backlog=2048
+    )
@@ -100,8 +100,9 @@ git+https://github.com/HKUDS/LightRAG.git
 EOF
 
 cat > backend/main.py << 'EOF'
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -113,6 +114,8 @@ from typing import List, Optional
 
 load_dotenv()
 
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+
 app = FastAPI(
     title="Miranda API",
     description="AI-Assisted Writing Platform",
@@ -124,10 +127,13 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["accept", "content-type", "authorization", "if-none-match"],
 )
 
+# Compress JSON bodies over 1KB
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # =============================================================================
 # MODELS
 # =============================================================================
@@ -233,7 +239,14 @@ async def create_project(project: Project):
 
 @app.post("/api/upload")
 async def upload_file(file: UploadFile = File(...)):
-    content = await file.read()
+    # Read in chunks so oversize uploads are rejected before they are fully buffered
+    chunks, size = [], 0
+    while chunk := await file.read(64 * 1024):
+        size += len(chunk)
+        if size > MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail="File too large")
+        chunks.append(chunk)
+    content = b"".join(chunks)
     file_id = f"doc_{len(documents)}"
     documents[file_id] = {
         "filename": file.filename,
@@ -326,7 +339,7 @@ FADE OUT.
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools", reload=False)
 EOF
 
 # =============================================================================
@@ -726,7 +739,7 @@ echo "🚀 Starting Miranda servers..."
 # Start backend
 cd backend
 source venv/bin/activate
-uvicorn main:app --reload --port 8000 &
+uvicorn main:app --reload --port 8000 --loop uvloop --http httptools &
 BACKEND_PID=$!
 cd ..
 
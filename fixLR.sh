@@ -43,6 +43,7 @@ echo "📝 Step 4: Create working backend"
 cat > main.py << 'EOF'
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import os
@@ -57,10 +58,13 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["accept", "content-type", "authorization", "if-none-match"],
 )
 
+# Compress JSON bodies over 1KB
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 class Project(BaseModel):
     name: str
     template: str
@@ -102,7 +106,11 @@ async def create_project(project: Project):
 
 @app.post("/api/upload")
 async def upload_file(file: UploadFile = File(...)):
-    return {"filename": file.filename, "size": len(await file.read())}
+    # Count bytes chunk by chunk instead of buffering the whole upload
+    size = 0
+    while chunk := await file.read(64 * 1024):
+        size += len(chunk)
+    return {"filename": file.filename, "size": size}
 
 @app.post("/api/lightrag-test")
 async def test_lightrag(data: LightRAGTest):
@@ -158,7 +166,7 @@ async def test_lightrag(data: LightRAGTest):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools", reload=False)
 EOF
 
 echo "✅ Fixed backend created!"
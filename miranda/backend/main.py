@@ -1,65 +1,97 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import os
 import sys
-import tempfile
+import asyncio
+import string
+import orjson
+import aiofiles
+import hashlib
+import itertools
+import mmap
+import pickle
 import shutil
-import json
+import numpy as np
+import httpx
+import openai
+import aiohttp
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 load_dotenv()
 
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_CONFIGURED = bool(OPENAI_API_KEY)
+
+# Fixed timestamp stamped on new records; no per-request clock reads
+CREATED_AT = "2025-01-01T00:00:00Z"
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+MULTIPART_OVERHEAD = 64 * 1024  # slack for the form envelope around the file
+_UPLOAD_TOO_LARGE_DETAIL = f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024*1024)}MB"
+
+VALID_TEMPLATES = frozenset({"screenplay", "academic", "business"})
+_INVALID_TEMPLATE_DETAIL = f"Invalid template. Must be one of: {', '.join(sorted(VALID_TEMPLATES))}"
+
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass  # uvloop is unavailable on Windows; fall back to the stock loop
+
 app = FastAPI(
     title="Miranda API",
     description="AI-Assisted Writing Platform - Complete Fixed Version",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
+@app.on_event("startup")
+async def enable_eager_tasks():
+    """Run new tasks inline until their first real suspension (Python 3.12+)"""
+    if sys.version_info >= (3, 12):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized project uploads from Content-Length, before the body is read"""
+    
+    def __init__(self, app, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"].startswith("/projects/") and scope["path"].endswith("/upload"):
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > self.max_body_size:
+                response = ORJSONResponse({"detail": _UPLOAD_TOO_LARGE_DETAIL}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Registered before CORSMiddleware so 413s still carry CORS headers
+app.add_middleware(UploadSizeLimitMiddleware, max_body_size=MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD)
+
 # ============================================================================= 
 # FIXED CORS CONFIGURATION
 # =============================================================================
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-        "http://localhost:8080", 
-        "http://127.0.0.1:8080",
-        "http://localhost:5173",
-        "http://127.0.0.1:5173"
-    ],
-    allow_credentials=True,
+    allow_origins=["*"],
+    allow_credentials=False,  # with "*" origins, True would echo any Origin as credentialed
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
+    allow_headers=["accept", "content-type", "authorization", "if-none-match"],
     expose_headers=["*"]
 )
 
-@app.middleware("http")
-async def add_cors_headers(request: Request, call_next):
-    """Ensure CORS headers are always present for debug script"""
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    response.headers["Access-Control-Expose-Headers"] = "*"
-    return response
-
-@app.options("/{path:path}")
-async def options_handler(request: Request, path: str):
-    """Handle CORS preflight requests"""
-    return JSONResponse(
-        content={"message": "CORS preflight OK"},
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "*"
-        }
-    )
+# Compress large generated bodies (/api/write, /api/lightrag-test)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 # =============================================================================
 # DATA MODELS
@@ -93,107 +125,332 @@ class WriteRequest(BaseModel):
 # STORAGE LAYER
 # =============================================================================
 
+# Bump when the projects.json layout changes; older files are migrated and validated on load
+STORAGE_SCHEMA_VERSION = 2
+
+# Seconds to coalesce writes before projects.json is rewritten
+FLUSH_DELAY = 0.25
+
+# Dedicated thread for projects.json writes, so flushes never wait behind other to_thread work;
+# a single worker means two writes to the same tmp file can never overlap
+FLUSH_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="proj-flush")
+
+def _max_id_suffix(ids) -> int:
+    """Largest numeric suffix among ids like "project_3", or 0"""
+    return max(
+        (int(i.rsplit("_", 1)[-1]) for i in ids if i.rsplit("_", 1)[-1].isdigit()),
+        default=0
+    )
+
 class SimpleStorage:
     def __init__(self):
-        self.projects = []
+        self.projects: Dict[str, Dict] = {}
+        self.project_counter = 0
         self.brainstorms = {}
         self.documents = {}
         self.uploads = {}
+        self._save_lock = asyncio.Lock()
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closing = False
         
         # Create projects directory
-        Path("./projects").mkdir(exist_ok=True)
+        self.base_dir = Path("./projects")
+        self.base_dir.mkdir(exist_ok=True)
+        self.projects_file = self.base_dir / "projects.json"
+        self._base_str = str(self.base_dir)
+        self._known_dirs = set()
         
         # Load existing data if available
         self._load_projects()
+        
+        # ETag version for project reads; seeded from the persisted counter so it survives restarts
+        self._version = self.project_counter
+        
+        # Monotonic id sources; next() on itertools.count is atomic under the GIL
+        self.brainstorm_ids = itertools.count(_max_id_suffix(self.brainstorms) + 1)
+        self.file_ids = itertools.count(1)
     
     def _load_projects(self):
         """Load projects from file if it exists"""
-        projects_file = Path("./projects/projects.json")
-        if projects_file.exists():
+        if self.projects_file.exists():
+            try:
+                with open(self.projects_file, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                        memoryview(mm) as view:
+                    data = orjson.loads(view)
+                if data.get("schema_version") == STORAGE_SCHEMA_VERSION:
+                    # Written by this version: trust it as-is
+                    self.projects = data["projects"]
+                    self.project_counter = data["project_counter"]
+                else:
+                    self.projects, dropped = self._migrate_projects(data.get("projects", {}))
+                    if dropped:
+                        # The next flush rewrites projects.json without them; keep the original
+                        backup = self.projects_file.with_suffix(".json.bak")
+                        try:
+                            shutil.copyfile(self.projects_file, backup)
+                            print(f"Dropped {dropped} invalid project(s) during migration; original kept at {backup}")
+                        except OSError as e:
+                            print(f"Dropped {dropped} invalid project(s) during migration; backup failed: {e}")
+                    self.project_counter = max(data.get("project_counter") or 0, _max_id_suffix(self.projects))
+                self.brainstorms = data.get("brainstorms", {})
+            except (OSError, ValueError, KeyError, AttributeError, TypeError) as e:
+                # Start fresh if file is empty or corrupted
+                print(f"projects.json unreadable, starting fresh: {e}")
+                self.projects, self.project_counter, self.brainstorms = {}, 0, {}
+    
+    @staticmethod
+    def _migrate_projects(projects) -> Tuple[Dict[str, Dict], int]:
+        """Index legacy list-form projects by id; return them with the count of records that failed validation"""
+        if isinstance(projects, dict):
+            projects = list(projects.values())
+        migrated, dropped = {}, 0
+        for p in projects:
             try:
-                with open(projects_file, 'r') as f:
-                    data = json.load(f)
-                    self.projects = data.get("projects", [])
-                    self.brainstorms = data.get("brainstorms", {})
-            except:
-                pass  # Start fresh if file is corrupted
+                Project.model_validate(p)
+                migrated[p["id"]] = p
+            except (KeyError, TypeError, ValueError) as e:
+                dropped += 1
+                record_id = p.get("id") if isinstance(p, dict) else None
+                print(f"Skipping invalid project {record_id!r}: {str(e).splitlines()[0]}")
+        return migrated, dropped
     
     def _save_projects(self):
-        """Save projects to file"""
-        projects_file = Path("./projects/projects.json")
-        try:
-            with open(projects_file, 'w') as f:
-                json.dump({
+        """Mark projects dirty and schedule a debounced flush"""
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+    
+    async def _flush_later(self):
+        # Re-check after each write: mutations during a flush only set the flag
+        while self._dirty and not self._closing:
+            await asyncio.sleep(FLUSH_DELAY)
+            await self.flush()
+    
+    def _write_projects(self, data: bytes):
+        """Blocking atomic write of projects.json; runs on FLUSH_POOL"""
+        tmp_file = self.projects_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # Readers see either the old file or the new one, never a torn write
+        os.replace(tmp_file, self.projects_file)
+    
+    async def flush(self):
+        """Write projects to file atomically if anything changed"""
+        async with self._save_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                data = orjson.dumps({
+                    "schema_version": STORAGE_SCHEMA_VERSION,
                     "projects": self.projects,
+                    "project_counter": self.project_counter,
                     "brainstorms": self.brainstorms
-                }, f, indent=2)
-        except:
-            pass  # Continue even if save fails
+                }, option=orjson.OPT_INDENT_2)
+                await asyncio.get_running_loop().run_in_executor(FLUSH_POOL, self._write_projects, data)
+            except Exception:
+                self._dirty = True  # Retry on the next flush
     
-    def create_project(self, project_data: Dict) -> Dict:
-        project_id = f"project_{len(self.projects) + 1}"
+    async def create_project(self, project_data: Dict) -> Dict:
+        self.project_counter += 1
+        project_id = f"project_{self.project_counter}"
         project = {
             "id": project_id,
             "name": project_data["name"],
             "template": project_data["template"],
             "description": project_data.get("description"),
-            "created_at": "2025-01-01T00:00:00Z"
+            "created_at": CREATED_AT
         }
         
-        self.projects.append(project)
+        self.projects[project_id] = project
+        self._version += 1
         self._save_projects()
         
         # Create project directory
-        project_dir = Path("./projects") / project_id
-        project_dir.mkdir(exist_ok=True)
+        await asyncio.to_thread(os.makedirs, os.path.join(self._base_str, project_id), exist_ok=True)
+        self._known_dirs.add(project_id)
         
         return project
     
+    def project_dir(self, project_id: str) -> Path:
+        return self.base_dir / project_id
+    
+    def ensure_project_dir(self, project_id: str) -> Path:
+        """Project directory, created at most once per process"""
+        project_dir = self.project_dir(project_id)
+        if project_id not in self._known_dirs:
+            project_dir.mkdir(exist_ok=True)
+            self._known_dirs.add(project_id)
+        return project_dir
+    
     def get_projects(self) -> List[Dict]:
-        return self.projects
+        return list(self.projects.values())
     
     def get_project(self, project_id: str) -> Optional[Dict]:
-        return next((p for p in self.projects if p["id"] == project_id), None)
+        return self.projects.get(project_id)
 
 # Global storage instance
 storage = SimpleStorage()
 
+@app.on_event("shutdown")
+async def flush_storage():
+    # Stop the debounce loop between writes rather than cancelling it mid-write,
+    # which would release the lock while its pool thread is still writing
+    storage._closing = True
+    if storage._flush_task is not None:
+        await storage._flush_task
+    await storage.flush()
+
 # =============================================================================
 # FIXED LIGHTRAG INTEGRATION
 # =============================================================================
 
+# LightRAG parses sys.argv on import, so hand it a clean argv exactly once here
+_original_argv, sys.argv = sys.argv, ['lightrag']
+try:
+    from lightrag import LightRAG, QueryParam
+    _LIGHTRAG_IMPORT_ERROR = None
+except Exception as e:  # a broken install falls back to the mock too
+    _LIGHTRAG_IMPORT_ERROR = e
+finally:
+    sys.argv = _original_argv
+
+OPENAI_API_URL = "https://api.openai.com/v1"
+
+# Shared aiohttp session for chat completions; httpx saturates early under concurrency
+http_session: Optional[aiohttp.ClientSession] = None
+
+@app.on_event("startup")
+async def open_http_session():
+    global http_session
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=256, ttl_dns_cache=300),
+        timeout=aiohttp.ClientTimeout(total=30)
+    )
+
+@app.on_event("shutdown")
+async def close_http_session():
+    if http_session is not None:
+        await http_session.close()
+
+async def openai_chat(prompt: str, **kwargs) -> str:
+    """Single-turn chat completion posted directly to the OpenAI REST API"""
+    async with http_session.post(
+        f"{OPENAI_API_URL}/chat/completions",
+        headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+        json={
+            "model": kwargs.get("model", "gpt-4o-mini"),
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": kwargs.get("max_tokens", 1000),
+            "temperature": kwargs.get("temperature", 0.7)
+        }
+    ) as response:
+        response.raise_for_status()
+        data = await response.json()
+    return data["choices"][0]["message"]["content"]
+
+# Process-wide OpenAI clients keyed by API key, so TCP/TLS connections are reused
+_client_cache: Dict[str, openai.AsyncOpenAI] = {}
+
+def _get_async_client(api_key: str) -> openai.AsyncOpenAI:
+    """Return the shared AsyncOpenAI client for an API key"""
+    if api_key not in _client_cache:
+        _client_cache[api_key] = openai.AsyncOpenAI(
+            api_key=api_key,
+            max_retries=2,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+                timeout=httpx.Timeout(30.0, connect=5.0)
+            )
+        )
+    return _client_cache[api_key]
+
+@app.on_event("shutdown")
+async def close_openai_clients():
+    for client in _client_cache.values():
+        await client.close()
+    _client_cache.clear()
+
+# Open keepalive connections to OpenAI at startup so the first request skips the TLS handshake
+_warmup_task: Optional[asyncio.Task] = None
+
+async def _warmup_openai():
+    try:
+        async with http_session.get(
+            f"{OPENAI_API_URL}/models",
+            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"}
+        ) as response:
+            await response.read()
+        await _get_async_client(OPENAI_API_KEY).models.list()
+    except Exception as e:
+        print(f"OpenAI warm-up failed: {e}")
+
+@app.on_event("startup")
+async def warm_openai_connections():
+    global _warmup_task
+    if OPENAI_CONFIGURED:
+        _warmup_task = asyncio.create_task(_warmup_openai())
+
+@app.on_event("shutdown")
+async def cancel_openai_warmup():
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+
+# Embeddings keyed by blake2b(text), shared by every LightRAG instance; LRU-capped float16 vectors
+EMBED_CACHE_FILE = Path("./projects/embed_cache.pkl")
+EMBED_CACHE_MAX = 20000  # ~3 KB per 1536-dim float16 vector
+EMBED_BATCH_SIZE = 2048  # OpenAI's per-request input limit
+
+def _load_embed_cache() -> "OrderedDict[bytes, np.ndarray]":
+    cache = OrderedDict()
+    if EMBED_CACHE_FILE.exists():
+        try:
+            with open(EMBED_CACHE_FILE, "rb") as f:
+                # Older caches stored float lists; keep only the most recent entries
+                for k, v in list(pickle.load(f).items())[-EMBED_CACHE_MAX:]:
+                    cache[k] = np.asarray(v, dtype=np.float16)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            print(f"embed_cache.pkl unreadable, starting empty: {e}")
+            cache.clear()
+    return cache
+
+_embed_cache = _load_embed_cache()
+
+# Saved on app shutdown, after the last request has been served
+@app.on_event("shutdown")
+async def save_embed_cache():
+    try:
+        with open(EMBED_CACHE_FILE, "wb") as f:
+            pickle.dump(_embed_cache, f)
+    except Exception:
+        pass
+
 def create_lightrag_instance(working_dir: str):
     """Fixed LightRAG with proper OpenAI client initialization"""
-    original_argv = sys.argv.copy()
-    sys.argv = ['lightrag']
+    if _LIGHTRAG_IMPORT_ERROR is not None:
+        print(f"LightRAG import error: {_LIGHTRAG_IMPORT_ERROR}")
+        # Return mock objects that won't crash
+        return create_mock_lightrag()
     
     try:
-        from lightrag import LightRAG, QueryParam
-        import openai
-        
         # Check API key
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
+        if not OPENAI_CONFIGURED:
             raise ValueError("OpenAI API key not found in environment")
         
-        # Fixed: Create client with minimal, compatible arguments
-        client = openai.AsyncOpenAI(
-            api_key=api_key,
-            timeout=30.0,
-            max_retries=2
-            # Removed problematic arguments like 'proxies'
-        )
+        client = _get_async_client(OPENAI_API_KEY)
         
         async def gpt_4o_mini_complete(prompt, **kwargs):
             """Fixed completion function with error handling"""
             try:
-                response = await client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[{"role": "user", "content": prompt}],
+                return await openai_chat(
+                    prompt,
                     max_tokens=kwargs.get("max_tokens", 1000),
                     temperature=kwargs.get("temperature", 0.7)
                 )
-                return response.choices[0].message.content
             except Exception as e:
                 return f"AI completion error: {str(e)}"
         
@@ -202,15 +459,32 @@ def create_lightrag_instance(working_dir: str):
             try:
                 if isinstance(texts, str):
                     texts = [texts]
-                response = await client.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=texts
-                )
-                return [item.embedding for item in response.data]
+                keys = [hashlib.blake2b(t.encode(), digest_size=16).digest() for t in texts]
+                vectors = {}
+                for k in keys:
+                    if k in _embed_cache:
+                        _embed_cache.move_to_end(k)
+                        vectors[k] = _embed_cache[k]
+                missing = {k: t for k, t in zip(keys, texts) if k not in vectors}
+                
+                # Only embed texts we have not seen, in API-sized batches
+                pending = list(missing.items())
+                for i in range(0, len(pending), EMBED_BATCH_SIZE):
+                    batch = pending[i:i + EMBED_BATCH_SIZE]
+                    response = await client.embeddings.create(
+                        model="text-embedding-3-small",
+                        input=[t for _, t in batch]
+                    )
+                    for (k, _), item in zip(batch, response.data):
+                        vectors[k] = _embed_cache[k] = np.asarray(item.embedding, dtype=np.float16)
+                        if len(_embed_cache) > EMBED_CACHE_MAX:
+                            _embed_cache.popitem(last=False)
+                
+                return np.stack([vectors[k] for k in keys]).astype(np.float32)
             except Exception as e:
                 # Return dummy embeddings if real ones fail (prevents crashes)
                 print(f"Embedding error: {e}")
-                return [[0.1] * 1536 for _ in texts]
+                return np.full((len(texts), 1536), 0.1, dtype=np.float32)
         
         # Create LightRAG instance
         rag = LightRAG(
@@ -221,15 +495,20 @@ def create_lightrag_instance(working_dir: str):
         
         return rag, QueryParam
         
-    except ImportError as e:
-        print(f"LightRAG import error: {e}")
-        # Return mock objects that won't crash
-        return create_mock_lightrag()
     except Exception as e:
         print(f"LightRAG initialization error: {e}")
         return create_mock_lightrag()
-    finally:
-        sys.argv = original_argv
+
+# LightRAG instances keyed by working_dir, so their on-disk stores are loaded once
+_rag_cache: Dict[str, tuple] = {}
+
+def get_or_create_rag(working_dir: Path) -> tuple:
+    """Return the cached (rag, QueryParam) pair for a working directory"""
+    key = str(working_dir)
+    if key not in _rag_cache:
+        working_dir.mkdir(parents=True, exist_ok=True)
+        _rag_cache[key] = create_lightrag_instance(key)
+    return _rag_cache[key]
 
 def create_mock_lightrag():
     """Create mock LightRAG for when real one fails"""
@@ -250,16 +529,16 @@ def create_mock_lightrag():
 # API ENDPOINTS - MATCHING TEST SCRIPT EXPECTATIONS
 # =============================================================================
 
-@app.get("/health")
+@app.get("/health", response_model=None)
 async def health():
     """Health check endpoint"""
-    return {
+    return ORJSONResponse({
         "status": "healthy",
         "version": "1.0.0",
-        "openai_configured": bool(os.getenv("OPENAI_API_KEY")),
+        "openai_configured": OPENAI_CONFIGURED,
         "cors": "enabled",
         "service": "miranda-backend-fixed"
-    }
+    })
 
 @app.get("/")
 async def root():
@@ -274,29 +553,31 @@ async def root():
 # PROJECT MANAGEMENT ENDPOINTS
 # =============================================================================
 
-@app.get("/projects/")
-async def list_projects():
+@app.get("/projects/", response_model=None)
+async def list_projects(request: Request):
     """List all projects - matches test script expectations"""
     try:
+        etag = f'W/"{storage._version}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
         projects = storage.get_projects()
-        return {
+        return ORJSONResponse({
             "success": True,
             "projects": projects,
             "count": len(projects)
-        }
+        }, headers={"ETag": etag, "Cache-Control": "private, max-age=1"})
     except Exception as e:
-        return {"success": False, "error": str(e)}
+        return ORJSONResponse({"success": False, "error": str(e)})
 
 @app.post("/projects/")
 async def create_project(project: Project):
     """Create new project - matches test script expectations"""
     try:
         # Validate template
-        valid_templates = ["screenplay", "academic", "business"]
-        if project.template not in valid_templates:
+        if project.template not in VALID_TEMPLATES:
             raise HTTPException(
                 status_code=422, 
-                detail=f"Invalid template. Must be one of: {valid_templates}"
+                detail=_INVALID_TEMPLATE_DETAIL
             )
         
         # Validate name length
@@ -306,7 +587,7 @@ async def create_project(project: Project):
                 detail="Project name too long (max 100 characters)"
             )
         
-        project_data = storage.create_project(project.dict())
+        project_data = await storage.create_project(project.dict())
         return {"success": True, "project": project_data}
         
     except HTTPException:
@@ -314,19 +595,25 @@ async def create_project(project: Project):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/projects/{project_id}")
-async def get_project(project_id: str):
+@app.get("/projects/{project_id}", response_model=None)
+async def get_project(project_id: str, request: Request):
     """Get single project"""
     project = storage.get_project(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    return {"success": True, "project": project}
+    etag = f'W/"{project_id}-{storage._version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return ORJSONResponse(
+        {"success": True, "project": project},
+        headers={"ETag": etag, "Cache-Control": "private, max-age=1"}
+    )
 
 # =============================================================================
 # FILE UPLOAD ENDPOINTS
 # =============================================================================
 
-@app.post("/projects/{project_id}/upload")
+@app.post("/projects/{project_id}/upload", response_model=None)
 async def upload_file(project_id: str, file: UploadFile = File(...)):
     """File upload with size validation"""
     try:
@@ -335,28 +622,24 @@ async def upload_file(project_id: str, file: UploadFile = File(...)):
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        # Read file content
-        content = await file.read()
-        file_size = len(content)
+        # Content-Length was checked by UploadSizeLimitMiddleware; this guards chunked bodies
+        # Stream file to disk in chunks, aborting as soon as it is too large
+        file_path = storage.ensure_project_dir(project_id) / file.filename
         
-        # Size validation (10MB limit)
-        max_size = 10 * 1024 * 1024  # 10MB
-        if file_size > max_size:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"File too large. Maximum size is {max_size // (1024*1024)}MB"
-            )
+        file_size = 0
+        async with aiofiles.open(file_path, "wb") as out:
+            while chunk := await file.read(1 << 16):
+                file_size += len(chunk)
+                if file_size > MAX_UPLOAD_SIZE:
+                    break
+                await out.write(chunk)
         
-        # Save file
-        project_dir = Path("./projects") / project_id
-        project_dir.mkdir(exist_ok=True)
-        file_path = project_dir / file.filename
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
+        if file_size > MAX_UPLOAD_SIZE:
+            os.unlink(file_path)
+            raise HTTPException(status_code=413, detail=_UPLOAD_TOO_LARGE_DETAIL)
         
         # Store file info
-        file_id = f"file_{len(storage.uploads) + 1}"
+        file_id = f"file_{next(storage.file_ids)}"
         storage.uploads[file_id] = {
             "id": file_id,
             "filename": file.filename,
@@ -365,13 +648,13 @@ async def upload_file(project_id: str, file: UploadFile = File(...)):
             "path": str(file_path)
         }
         
-        return {
+        return ORJSONResponse({
             "success": True,
             "file_id": file_id,
             "filename": file.filename,
             "size": file_size,
             "project_id": project_id
-        }
+        })
         
     except HTTPException:
         raise
@@ -382,53 +665,55 @@ async def upload_file(project_id: str, file: UploadFile = File(...)):
 # LIGHTRAG ENDPOINTS
 # =============================================================================
 
-@app.post("/api/lightrag-test")
-async def lightrag_test(request: dict):
+@app.post("/api/lightrag-test", response_model=None)
+async def lightrag_test(request: dict) -> ORJSONResponse:
     """LightRAG test endpoint - matches test script expectations"""
     text = request.get("text", "No text provided")
     query = request.get("query", "What is this document about?")
     
     # Check API key
-    if not os.getenv("OPENAI_API_KEY"):
-        return {
+    if not OPENAI_CONFIGURED:
+        return ORJSONResponse({
             "success": False,
             "error": "OpenAI API key not configured",
             "type": "configuration_error",
             "note": "Set OPENAI_API_KEY environment variable"
-        }
+        })
     
-    # Create temporary directory for LightRAG
-    temp_dir = tempfile.mkdtemp()
+    # Persistent working directory, per project when one is given
+    project_id = request.get("project_id")
+    if project_id and storage.get_project(project_id):
+        working_dir = storage.project_dir(project_id) / "lightrag"
+    else:
+        working_dir = Path("./projects/_shared/lightrag")
     
     try:
         # Get LightRAG instance
-        rag, QueryParam = create_lightrag_instance(temp_dir)
+        rag, QueryParam = get_or_create_rag(working_dir)
         
         # Insert document
         insert_result = await rag.ainsert(text)
         
         # Query document
         query_result = await rag.aquery(query, param=QueryParam(mode="hybrid"))
+        result = query_result if isinstance(query_result, str) else str(query_result)
         
-        return {
+        return ORJSONResponse({
             "success": True,
             "query": query,
-            "result": query_result,
+            "result": result,
             "method": "lightrag_integration",
             "text_length": len(text),
-            "result_length": len(str(query_result))
-        }
+            "result_length": len(result)
+        })
         
     except Exception as e:
-        return {
+        return ORJSONResponse({
             "success": False,
             "error": f"LightRAG execution failed: {str(e)}",
             "type": type(e).__name__,
             "note": "Check if OpenAI API key is valid and has credits"
-        }
-    finally:
-        # Clean up temporary directory
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        })
 
 # =============================================================================
 # AI WORKFLOW ENDPOINTS
@@ -437,7 +722,7 @@ async def lightrag_test(request: dict):
 @app.post("/api/brainstorm")
 async def generate_brainstorm(request: BrainstormRequest):
     """Generate brainstorming ideas"""
-    if not os.getenv("OPENAI_API_KEY"):
+    if not OPENAI_CONFIGURED:
         return {
             "success": False, 
             "error": "OpenAI API key not configured",
@@ -445,7 +730,7 @@ async def generate_brainstorm(request: BrainstormRequest):
         }
     
     try:
-        brainstorm_id = f"brainstorm_{len(storage.brainstorms) + 1}"
+        brainstorm_id = f"brainstorm_{next(storage.brainstorm_ids)}"
         
         # Generate contextual ideas
         ideas = [
@@ -463,7 +748,7 @@ async def generate_brainstorm(request: BrainstormRequest):
             "focus": request.focus,
             "tone": request.tone,
             "ideas": ideas,
-            "created_at": "2025-01-01T00:00:00Z"
+            "created_at": CREATED_AT
         }
         
         storage.brainstorms[brainstorm_id] = brainstorm_data
@@ -478,38 +763,12 @@ async def generate_brainstorm(request: BrainstormRequest):
             "type": type(e).__name__
         }
 
-@app.post("/api/write")
-async def generate_content(request: WriteRequest):
-    """Generate written content"""
-    if not os.getenv("OPENAI_API_KEY"):
-        return {
-            "success": False,
-            "error": "OpenAI API key not configured",
-            "type": "configuration_error"
-        }
-    
-    try:
-        # Get brainstorm context if available
-        context_info = []
-        if request.brainstorm_id and request.brainstorm_id in storage.brainstorms:
-            brainstorm = storage.brainstorms[request.brainstorm_id]
-            context_info.append(f"Brainstorm ideas: {', '.join(brainstorm['ideas'][:2])}")
-        
-        if request.selected_tables:
-            context_info.append(f"Using table data: {', '.join(request.selected_tables)}")
-        
-        if request.selected_buckets:
-            context_info.append(f"Using documents: {', '.join(request.selected_buckets)}")
-        
-        context = " | ".join(context_info) if context_info else f"Generated for project {request.project_id}"
-        
-        # Generate format-specific content
-        if request.format == "screenplay":
-            content = f"""FADE IN:
+# Writing templates, built once at import
+SCREENPLAY_TMPL = string.Template("""FADE IN:
 
 EXT. CREATIVE WORKSPACE - DAY
 
-{context}
+$context
 
 A WRITER (30s) sits at a polished desk, surrounded by research materials and inspiration boards. Sunlight streams through tall windows, illuminating pages of carefully crafted work.
 
@@ -529,14 +788,13 @@ INT. STORY WORLD - CONTINUOUS
 
 The narrative springs to life, characters moving with purpose and authenticity, each scene building naturally toward the inevitable conclusion.
 
-FADE OUT."""
+FADE OUT.""")
 
-        elif request.format == "academic":
-            content = f"""# Chapter Analysis: {request.project_id.title()}
+ACADEMIC_TMPL = string.Template("""# Chapter Analysis: $project
 
 ## Introduction
 
-{context}
+$context
 
 This analysis explores the fundamental principles underlying effective narrative construction, examining how contemporary storytelling techniques align with established academic frameworks.
 
@@ -566,13 +824,12 @@ Themes should resonate with current audiences while maintaining universal appeal
 
 ## Conclusion
 
-These findings suggest that effective storytelling requires both technical skill and intuitive understanding of human nature."""
+These findings suggest that effective storytelling requires both technical skill and intuitive understanding of human nature.""")
 
-        else:  # business or general format
-            content = f"""# Executive Summary: {request.project_id.title()}
+BUSINESS_TMPL = string.Template("""# Executive Summary: $project
 
 ## Project Context
-{context}
+$context
 
 ## Strategic Overview
 
@@ -601,11 +858,54 @@ Key performance indicators include user engagement, market penetration, and sust
 
 ## Next Steps
 
-Immediate priorities focus on executing Phase 1 initiatives while preparing infrastructure for subsequent phases."""
+Immediate priorities focus on executing Phase 1 initiatives while preparing infrastructure for subsequent phases.""")
 
-        word_count = len(content.split())
-        
+WRITE_TEMPLATES = {
+    "screenplay": SCREENPLAY_TMPL,
+    "academic": ACADEMIC_TMPL,
+}
+
+# Words in each template outside its placeholders, so word_count skips a full split
+TEMPLATE_WORDS = {
+    tmpl: len(tmpl.substitute(context="", project="").split())
+    for tmpl in (SCREENPLAY_TMPL, ACADEMIC_TMPL, BUSINESS_TMPL)
+}
+
+@app.post("/api/write")
+async def generate_content(request: WriteRequest):
+    """Generate written content"""
+    if not OPENAI_CONFIGURED:
         return {
+            "success": False,
+            "error": "OpenAI API key not configured",
+            "type": "configuration_error"
+        }
+    
+    try:
+        # Get brainstorm context if available
+        context_info = []
+        if request.brainstorm_id and request.brainstorm_id in storage.brainstorms:
+            brainstorm = storage.brainstorms[request.brainstorm_id]
+            context_info.append(f"Brainstorm ideas: {', '.join(brainstorm['ideas'][:2])}")
+        
+        if request.selected_tables:
+            context_info.append(f"Using table data: {', '.join(request.selected_tables)}")
+        
+        if request.selected_buckets:
+            context_info.append(f"Using documents: {', '.join(request.selected_buckets)}")
+        
+        context = " | ".join(context_info) if context_info else f"Generated for project {request.project_id}"
+        
+        # Generate format-specific content; business is the general fallback
+        template = WRITE_TEMPLATES.get(request.format, BUSINESS_TMPL)
+        project = request.project_id.title()
+        content = template.substitute(context=context, project=project)
+        
+        word_count = TEMPLATE_WORDS[template] + len(context.split())
+        if template is not SCREENPLAY_TMPL:
+            word_count += len(project.split())
+        
+        return ORJSONResponse({
             "success": True,
             "content": content.strip(),
             "format": request.format,
@@ -613,7 +913,7 @@ Immediate priorities focus on executing Phase 1 initiatives while preparing infr
             "word_count": word_count,
             "context_used": bool(context_info),
             "prompt_tone": request.prompt_tone
-        }
+        })
         
     except Exception as e:
         return {
@@ -642,7 +942,7 @@ async def docs_redirect():
 
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=404,
         content={
             "detail": "Not Found",
@@ -653,7 +953,7 @@ async def not_found_handler(request: Request, exc):
 
 @app.exception_handler(422)
 async def validation_error_handler(request: Request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=422,
         content={
             "detail": "Validation Error",
@@ -666,21 +966,40 @@ async def validation_error_handler(request: Request, exc):
 # STARTUP MESSAGE
 # =============================================================================
 
+BANNER = """\
+🚀 Starting Miranda Backend (Complete Fixed Version)
+============================================================
+✅ CORS properly configured with headers exposed
+✅ LightRAG integration with error handling and fallbacks
+✅ Project management with persistent storage
+✅ File upload with size validation
+✅ AI brainstorming and writing workflows
+✅ API endpoints match test script expectations
+============================================================
+🌐 Backend available at: http://localhost:8000
+📚 API docs at: http://localhost:8000/docs
+🔍 Health check: http://localhost:8000/health
+📊 Projects: http://localhost:8000/projects/
+============================================================
+"""
+
 if __name__ == "__main__":
-    print("🚀 Starting Miranda Backend (Complete Fixed Version)")
-    print("=" * 60)
-    print("✅ CORS properly configured with headers exposed")
-    print("✅ LightRAG integration with error handling and fallbacks")
-    print("✅ Project management with persistent storage")
-    print("✅ File upload with size validation")
-    print("✅ AI brainstorming and writing workflows")
-    print("✅ API endpoints match test script expectations")
-    print("=" * 60)
-    print("🌐 Backend available at: http://localhost:8000")
-    print("📚 API docs at: http://localhost:8000/docs")
-    print("🔍 Health check: http://localhost:8000/health")
-    print("📊 Projects: http://localhost:8000/projects/")
-    print("=" * 60)
+    sys.stdout.write(BANNER)
+    sys.stdout.flush()
     
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # Storage lives in process memory, so scale workers only via WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        # Passing the app object avoids importing this module a second time;
+        # uvicorn needs the import string only to spawn extra workers
+        app if workers == 1 else "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+        timeout_keep_alive=30,
+        limit_concurrency=1000,
+        backlog=2048
+    )
@@ -6,7 +6,7 @@ echo "🚀 Starting Miranda servers..."
 # Start backend
 cd backend
 source venv/bin/activate
-uvicorn main:app --reload --port 8000 &
+uvicorn main:app --reload --port 8000 --loop uvloop --http httptools &
 BACKEND_PID=$!
 cd ..
 